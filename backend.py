@@ -1,12 +1,21 @@
 import os
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from cachetools import LRUCache, TTLCache, cached
 from flask import Flask, request, jsonify, send_from_directory, send_file
 from flask_cors import CORS
 import json
 import math
 import io
+import hashlib
+import tempfile
+import threading
+from typing import NamedTuple
 import numpy as np
 import traceback
+from functools import lru_cache
+from concurrent.futures import ThreadPoolExecutor
 
 # Imports
 from astropy.coordinates import get_icrs_coordinates, SkyCoord, EarthLocation, AltAz
@@ -14,12 +23,34 @@ from astropy.time import Time
 from astropy import units as u
 from astropy.wcs import WCS
 from PIL import Image
-from reproject import reproject_interp
+from scipy.ndimage import map_coordinates
+
+# Optional GPU acceleration for reprojection
+try:
+    import cupy as cp
+    from cupyx.scipy.ndimage import map_coordinates as gpu_map_coordinates
+except ImportError:
+    cp = None
+
+# Optional Numba JIT for the per-pixel kernels
+try:
+    from numba import njit, prange
+except ImportError:
+    njit = None
+
+# Optional libjpeg-turbo encoder, falls back to Pillow if not installed
+try:
+    import simplejpeg
+except ImportError:
+    simplejpeg = None
 
 # --- Configuration ---
 Image.MAX_IMAGE_PIXELS = None
 app = Flask(__name__, static_folder='.', static_url_path='')
 CORS(app)
+# Behind a proxy that supports X-Sendfile (e.g. Apache mod_xsendfile), set USE_X_SENDFILE=1 so
+# static files are streamed by the proxy with sendfile(2) instead of being copied through Flask
+app.use_x_sendfile = os.environ.get('USE_X_SENDFILE') == '1'
 
 # API Constants & Key Loading
 ASTROMETRY_API_URL = 'http://nova.astrometry.net/api'
@@ -28,33 +59,109 @@ try:
 except ImportError:
     API_KEY = None
 
+# Shared HTTP session so calls to Astrometry.net reuse keep-alive connections instead of
+# opening a new TCP connection each time. Idempotent requests are retried on transient errors.
+astrometry_session = requests.Session()
+astrometry_adapter = HTTPAdapter(pool_connections=4, pool_maxsize=16, max_retries=Retry(total=3, backoff_factor=0.1))
+astrometry_session.mount('http://', astrometry_adapter)
+astrometry_session.mount('https://', astrometry_adapter)
+
+# Status responses are shared between polls for a few seconds, so many clients polling the
+# same submission only cause one upstream request per interval
+astrometry_status_cache = TTLCache(maxsize=2048, ttl=3.0)
+astrometry_status_lock = threading.Lock()
+
+# Padding (in skymap pixels) added around the camera FOV when cropping the skymap
+SKYMAP_CROP_PADDING_PX = 10
+# Threads used for CPU reprojection, and the smallest strip of output rows worth giving a thread
+REPROJECT_WORKERS = os.cpu_count() or 1
+REPROJECT_MIN_STRIP_HEIGHT = 256
+# With SKYMAP_BINNING=1 and Numba installed, output pixels at least this many times larger than skymap
+# pixels are binned instead of interpolated. Binning avoids aliasing but reads every skymap pixel in the
+# FOV, so for wide fields it is slower than interpolating and is off by default.
+SKYMAP_BINNING = os.environ.get('SKYMAP_BINNING') == '1'
+SKYMAP_BINNING_MIN_RATIO = 2
+# Directory for rendered skymap crops, reused across server restarts, and the size it is pruned back to
+SKYMAP_CACHE_DIR = 'cache'
+SKYMAP_CACHE_DIR_MAX_BYTES = 1024 * 1024 * 1024
+# Total size of the encoded images kept in memory
+SKYMAP_CACHE_MEMORY_MAX_BYTES = 128 * 1024 * 1024
+# Bump whenever a change alters the rendered output, so images cached by older code are not served
+SKYMAP_RENDER_VERSION = 4
+# Encoder settings for the supported skymap preview formats: (PIL format, mimetype, save options)
+SKYMAP_IMAGE_FORMATS = {
+    'jpeg': ('JPEG', 'image/jpeg', {'quality': 85, 'optimize': False}),
+    'png': ('PNG', 'image/png', {'compress_level': 1}),
+}
+
 # Global State for pre-loading the skymap
 session_key = None
+numba_parallel_lock = threading.Lock()
 input_data = None
+input_data_gpu = None
 input_wcs = None
+# Identifies the loaded skymap file, so cached renders of a replaced skymap are not reused
+skymap_version = None
 
 # --- Core Service Functions ---
+def atomic_write(path, write_fn):
+    """Writes a file by calling write_fn with a binary file object, replacing path only once it is complete.
+
+    The data goes to a temporary file in the same directory first, so readers never see a partial file
+    and a failed or interrupted write leaves nothing behind.
+    """
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(path)), suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            write_fn(f)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+
+def decode_skymap(image_path, npy_path):
+    """Decodes the skymap image once and saves it as a (3, H, W) uint8 .npy file."""
+    composite_image = Image.open(image_path)
+    if composite_image.mode != 'RGB':
+        composite_image = composite_image.convert('RGB')
+    # Store the RGB channels as a single contiguous (3, H, W) uint8 array so they can be reprojected in one pass.
+    # Each channel is copied straight into its block, so no full-size interleaved copies are made.
+    decoded = np.empty((3, composite_image.height, composite_image.width), dtype=np.uint8)
+    for c in range(3):
+        decoded[c] = np.asarray(composite_image.getchannel(c))
+
+    # An interrupted conversion never leaves a truncated .npy behind
+    atomic_write(npy_path, lambda f: np.save(f, decoded))
+
+
 def load_skymap_data():
     """Pre-loads the single skymap image and computes its WCS at server startup."""
-    global input_data, input_wcs
+    global input_data, input_data_gpu, input_wcs, skymap_version
     
     composite_map_path = 'composite_skymap_16k.png'
+    # Decoded copy of the skymap, memory-mapped so that only the pages actually sampled are read
+    decoded_map_path = 'composite_skymap_16k.npy'
     print(f"Attempting to pre-load skymap: {composite_map_path}")
 
-    if not os.path.exists(composite_map_path):
+    if not os.path.exists(composite_map_path) and not os.path.exists(decoded_map_path):
         print(f"FATAL: Skymap file not found at '{composite_map_path}'. The skymap feature will not work.")
         return
 
     try:
-        composite_image = Image.open(composite_map_path)
-        # Separate the RGB channels for reprojection
-        r, g, b = composite_image.split()
-        input_data = (np.array(r), np.array(g), np.array(b))
+        if os.path.exists(composite_map_path) and (not os.path.exists(decoded_map_path) or
+                                                   os.path.getmtime(decoded_map_path) < os.path.getmtime(composite_map_path)):
+            print(f"Decoding skymap into '{decoded_map_path}', this is only needed once...")
+            decode_skymap(composite_map_path, decoded_map_path)
+        input_data = np.load(decoded_map_path, mmap_mode='r')
+        map_height, map_width = input_data.shape[-2:]
+        decoded_stat = os.stat(decoded_map_path)
+        skymap_version = f"{decoded_stat.st_size}-{decoded_stat.st_mtime_ns}"
 
         # WCS Definition for the single full-sky image
         w = WCS(naxis=2)
-        w.wcs.crpix = [(composite_image.width + 1) / 2, (composite_image.height + 1) / 2]
-        w.wcs.cdelt = np.array([-360. / composite_image.width, -180. / composite_image.height])
+        w.wcs.crpix = [(map_width + 1) / 2, (map_height + 1) / 2]
+        w.wcs.cdelt = np.array([-360. / map_width, -180. / map_height])
         w.wcs.crval = [0, 0]
         w.wcs.ctype = ["RA---CAR", "DEC--CAR"]
         input_wcs = w
@@ -64,6 +171,500 @@ def load_skymap_data():
         print(f"CRITICAL ERROR during skymap pre-load: {e}")
         input_data = None
         input_wcs = None
+        return
+
+    # Keep a copy of the skymap resident in GPU memory if CuPy is available
+    if cp is not None:
+        try:
+            input_data_gpu = cp.asarray(input_data)
+            print("Skymap data uploaded to GPU.")
+        except Exception as e:
+            print(f"WARNING: Could not upload skymap to GPU, falling back to CPU reprojection: {e}")
+            input_data_gpu = None
+
+    warm_up_skymap_pipeline()
+
+
+def warm_up_skymap_pipeline():
+    """Runs each reprojection path once on a tiny frame so the first real request is not slowed down.
+
+    This compiles (or loads from Numba's on-disk cache) every JIT kernel and initialises the lazily
+    loaded astropy WCS machinery.
+    """
+    try:
+        output_wcs = WCS(naxis=2)
+        output_wcs.wcs.crpix = [16.5, 16.5]
+        output_wcs.wcs.crval = [0, 0]
+        output_wcs.wcs.ctype = ["RA---TAN", "DEC--TAN"]
+        output_shape = (3, 32, 32)
+
+        # Fine pixels go through interpolation, coarse pixels through binning
+        output_wcs.wcs.cdelt = np.abs(input_wcs.wcs.cdelt) * [-0.5, 0.5]
+        reproject_skymap_cpu(output_wcs, output_shape)
+        if input_data_gpu is not None:
+            finalize_channels(reproject_skymap_gpu(output_wcs, output_shape))
+        if SKYMAP_BINNING and njit is not None:
+            output_wcs.wcs.cdelt = np.abs(input_wcs.wcs.cdelt) * [-SKYMAP_BINNING_MIN_RATIO, SKYMAP_BINNING_MIN_RATIO]
+            bin_skymap_to_frame(output_wcs, output_shape)
+        print("Skymap reprojection warmed up.")
+    except Exception as e:
+        print(f"WARNING: Skymap warm-up failed, the first request may be slow: {e}")
+
+
+def crop_skymap_to_fov(output_wcs, output_shape):
+    """Crops the pre-loaded skymap to the region covered by the output frame.
+
+    Returns a (data, wcs) tuple to resample the output frame from. Crops that cross
+    the RA seam of the skymap are wrapped around so they stay a single contiguous array.
+    """
+    height, width = output_shape[-2:]
+    map_height, map_width = input_data.shape[-2:]
+
+    # Sample the whole border of the frame at every pixel, as the edges of a TAN projection curve in CAR.
+    # Near a pole the Dec along an edge peaks sharply at the border point closest to the pole, so those
+    # points are added too.
+    pole_x, pole_y = output_wcs.wcs_world2pix([0, 0], [90, -90], 0)
+    edge_x = np.arange(width + 1) - 0.5
+    edge_y = np.arange(height + 1) - 0.5
+    border_x = np.concatenate([edge_x, edge_x, np.full(height + 1, -0.5), np.full(height + 1, width - 0.5),
+                               np.clip(pole_x[np.isfinite(pole_x)], -0.5, width - 0.5)])
+    border_y = np.concatenate([np.full(width + 1, -0.5), np.full(width + 1, height - 0.5), edge_y, edge_y,
+                               np.clip(pole_y[np.isfinite(pole_y)], -0.5, height - 0.5)])
+    border_ra, border_dec = output_wcs.wcs_pix2world(border_x, border_y, 0)
+
+    # RA offsets are measured from the frame centre so they do not jump at 0/360
+    center_ra = output_wcs.wcs.crval[0]
+    delta_ra = (border_ra - center_ra + 180) % 360 - 180
+    dec_min, dec_max = border_dec.min(), border_dec.max()
+    x_center, _ = input_wcs.wcs_world2pix([center_ra], [0], 0)
+    map_x = x_center[0] + np.array([delta_ra.min(), delta_ra.max()]) / input_wcs.wcs.cdelt[0]
+
+    x0 = int(math.floor(map_x.min())) - SKYMAP_CROP_PADDING_PX
+    x1 = int(math.ceil(map_x.max())) + SKYMAP_CROP_PADDING_PX + 1
+
+    # If a celestial pole is inside the frame every RA is visible, so take all columns (wrapped
+    # past the seam on both sides) and every row up to the pole
+    pole_inside = (pole_x >= -0.5) & (pole_x <= width - 0.5) & (pole_y >= -0.5) & (pole_y <= height - 0.5)
+    if pole_inside[0]:
+        dec_max = 90
+    if pole_inside[1]:
+        dec_min = -90
+    if np.any(pole_inside) or x1 - x0 > map_width + 2 * SKYMAP_CROP_PADDING_PX:
+        x0, x1 = -SKYMAP_CROP_PADDING_PX, map_width + SKYMAP_CROP_PADDING_PX
+
+    _, map_y = input_wcs.wcs_world2pix([center_ra, center_ra], [dec_min, dec_max], 0)
+    y0 = max(int(math.floor(map_y.min())) - SKYMAP_CROP_PADDING_PX, 0)
+    y1 = min(int(math.ceil(map_y.max())) + SKYMAP_CROP_PADDING_PX + 1, map_height)
+
+    # Column indices outside the skymap wrap around to the other side of the RA seam
+    columns = np.arange(x0, x1) % map_width
+    cropped_data = np.take(input_data[:, y0:y1], columns, axis=-1)
+
+    # Re-centre the crop WCS on its middle column so wcslib never normalises across the seam
+    mid_column = (x1 - x0) // 2
+    cropped_wcs = input_wcs.deepcopy()
+    cropped_wcs.wcs.crval[0] = (input_wcs.wcs.crval[0] + (x0 + mid_column + 1 - input_wcs.wcs.crpix[0]) * input_wcs.wcs.cdelt[0]) % 360
+    cropped_wcs.wcs.crpix = [mid_column + 1, input_wcs.wcs.crpix[1] - y0]
+    return cropped_data, cropped_wcs
+
+
+if njit is not None:
+    @njit(inline='always', fastmath=True, cache=True)
+    def _tan_to_car_pixel(xi, eta, ra0, sin_dec0, cos_dec0,
+                          map_crpix_x, map_crpix_y, map_cdelt_x, map_cdelt_y, map_ra0, map_dec0):
+        # Same maths as the NumPy version of tan_to_car_pixels below, for a single pixel
+        denom = cos_dec0 - eta * sin_dec0
+        ra = ra0 + math.degrees(math.atan2(xi, denom))
+        dec = math.degrees(math.atan2(sin_dec0 + eta * cos_dec0, math.sqrt(xi * xi + denom * denom)))
+        y = map_crpix_y - 1 + (dec - map_dec0) / map_cdelt_y
+        x = map_crpix_x - 1 + ((ra - map_ra0 + 180) % 360 - 180) / map_cdelt_x
+        return y, x
+
+    @njit(nogil=True, fastmath=True, cache=True)
+    def _tan_to_car_pixels_kernel(out_crpix_x, out_crpix_y, out_cdelt_x, out_cdelt_y, ra0, dec0,
+                                  map_crpix_x, map_crpix_y, map_cdelt_x, map_cdelt_y, map_ra0, map_dec0,
+                                  y0, coords):
+        # Fused into one pass with no temporary arrays
+        sin_dec0 = math.sin(math.radians(dec0))
+        cos_dec0 = math.cos(math.radians(dec0))
+        for i in range(coords.shape[1]):
+            eta = math.radians((y0 + i + 1 - out_crpix_y) * out_cdelt_y)
+            for j in range(coords.shape[2]):
+                xi = math.radians((j + 1 - out_crpix_x) * out_cdelt_x)
+                coords[0, i, j], coords[1, i, j] = _tan_to_car_pixel(
+                    xi, eta, ra0, sin_dec0, cos_dec0,
+                    map_crpix_x, map_crpix_y, map_cdelt_x, map_cdelt_y, map_ra0, map_dec0)
+
+    @njit(nogil=True, fastmath=True, cache=True)
+    def _reproject_bilinear_kernel(image, out_crpix_x, out_crpix_y, out_cdelt_x, out_cdelt_y, ra0, dec0,
+                                   map_crpix_x, map_crpix_y, map_cdelt_x, map_cdelt_y, map_ra0, map_dec0,
+                                   y0, out):
+        # Maps each output pixel and samples all channels of the uint8 image bilinearly, writing uint8
+        # straight into the (rows, W, 3) output. No coordinate or float image arrays are materialised.
+        # Positions outside the image are clamped to its edge, like mode='nearest'.
+        sin_dec0 = math.sin(math.radians(dec0))
+        cos_dec0 = math.cos(math.radians(dec0))
+        max_y = image.shape[1] - 1
+        max_x = image.shape[2] - 1
+        for i in range(out.shape[0]):
+            eta = math.radians((y0 + i + 1 - out_crpix_y) * out_cdelt_y)
+            for j in range(out.shape[1]):
+                xi = math.radians((j + 1 - out_crpix_x) * out_cdelt_x)
+                y, x = _tan_to_car_pixel(xi, eta, ra0, sin_dec0, cos_dec0,
+                                         map_crpix_x, map_crpix_y, map_cdelt_x, map_cdelt_y, map_ra0, map_dec0)
+                y = min(max(y, 0.0), max_y)
+                x = min(max(x, 0.0), max_x)
+                iy = min(int(y), max_y - 1)
+                ix = min(int(x), max_x - 1)
+                fy = y - iy
+                fx = x - ix
+                for c in range(image.shape[0]):
+                    top = (1 - fx) * image[c, iy, ix] + fx * image[c, iy, ix + 1]
+                    bottom = (1 - fx) * image[c, iy + 1, ix] + fx * image[c, iy + 1, ix + 1]
+                    out[i, j, c] = np.uint8((1 - fy) * top + fy * bottom)
+
+
+def tan_to_car_pixels(output_wcs, map_wcs, width, y0, y1):
+    """Maps rows y0:y1 of a TAN output frame to pixel positions in a CAR skymap.
+
+    This is the closed-form equivalent of astropy's pixel_to_pixel for the simple WCS used here
+    (no rotation, CAR reference point on the equator), without the round trip through wcslib.
+    Returns a (2, y1 - y0, width) float32 array of 0-based (y, x) skymap pixel coordinates.
+    """
+    coords = np.empty((2, y1 - y0, width), dtype=np.float32)
+    if njit is not None:
+        _tan_to_car_pixels_kernel(*output_wcs.wcs.crpix, *output_wcs.wcs.cdelt, *output_wcs.wcs.crval,
+                                  *map_wcs.wcs.crpix, *map_wcs.wcs.cdelt, *map_wcs.wcs.crval, y0, coords)
+        return coords
+
+    # Output pixels -> intermediate TAN coordinates (radians)
+    xi = np.radians((np.arange(width) + 1 - output_wcs.wcs.crpix[0]) * output_wcs.wcs.cdelt[0])
+    eta = np.radians((np.arange(y0, y1) + 1 - output_wcs.wcs.crpix[1]) * output_wcs.wcs.cdelt[1])[:, None]
+
+    # Inverse gnomonic projection -> RA/Dec (degrees)
+    ra0, dec0 = output_wcs.wcs.crval
+    denom = np.cos(np.radians(dec0)) - eta * np.sin(np.radians(dec0))
+    ra = ra0 + np.degrees(np.arctan2(xi, denom))
+    dec = np.degrees(np.arctan2(np.sin(np.radians(dec0)) + eta * np.cos(np.radians(dec0)), np.hypot(xi, denom)))
+
+    # CAR projection -> skymap pixels, measuring RA from the map reference so it never jumps at 0/360
+    coords[0] = map_wcs.wcs.crpix[1] - 1 + (dec - map_wcs.wcs.crval[1]) / map_wcs.wcs.cdelt[1]
+    coords[1] = map_wcs.wcs.crpix[0] - 1 + ((ra - map_wcs.wcs.crval[0] + 180) % 360 - 180) / map_wcs.wcs.cdelt[0]
+    return coords
+
+
+if njit is not None:
+    @njit(parallel=True, cache=True)
+    def _finalize_channels_kernel(channel_data, out):
+        # fastmath is left off here as it would let LLVM drop the NaN check
+        for i in prange(channel_data.shape[1]):
+            for j in range(channel_data.shape[2]):
+                for k in range(channel_data.shape[0]):
+                    v = channel_data[k, i, j]
+                    if np.isnan(v) or v < 0:
+                        v = 0
+                    elif v > 255:
+                        v = 255
+                    out[i, j, k] = np.uint8(v)
+
+
+def finalize_channels(channel_data):
+    """Converts reprojected (3, H, W) float channels into an (H, W, 3) uint8 RGB image.
+
+    NaNs (pixels outside the skymap) become black and values are clamped to [0, 255].
+    With Numba this is done in a single pass over the data.
+    """
+    if njit is None:
+        return np.ascontiguousarray(np.clip(np.nan_to_num(np.moveaxis(channel_data, 0, -1)), 0, 255).astype(np.uint8))
+
+    out = np.empty((channel_data.shape[1], channel_data.shape[2], channel_data.shape[0]), dtype=np.uint8)
+    # Numba's default workqueue threading layer does not allow concurrent parallel launches
+    with numba_parallel_lock:
+        _finalize_channels_kernel(channel_data, out)
+    return out
+
+
+def reproject_skymap_gpu(output_wcs, output_shape):
+    """Reprojects the GPU-resident skymap onto the output frame with CuPy.
+
+    The pixel mapping is computed once on the CPU and the bilinear
+    resampling of each channel is done on the GPU. Returns a (3, H, W) float array.
+    """
+    height, width = output_shape[-2:]
+    coords = tan_to_car_pixels(output_wcs, input_wcs, width, 0, height)
+    # grid-wrap wraps both axes, but only RA is periodic: clamp rows so the poles are never
+    # blended with the opposite pole's row
+    np.clip(coords[0], 0, input_data_gpu.shape[1] - 1, out=coords[0])
+    coords_gpu = cp.asarray(coords)
+
+    channel_data = cp.empty((input_data_gpu.shape[0], height, width), dtype=cp.float32)
+    # The full-sky map wraps around in RA, so sample across the seam instead of padding with NaNs
+    for c in range(input_data_gpu.shape[0]):
+        gpu_map_coordinates(input_data_gpu[c], coords_gpu, output=channel_data[c], order=1, mode='grid-wrap')
+    return cp.asnumpy(channel_data)
+
+
+def split_into_strips(height):
+    """Splits rows 0:height into one horizontal (y0, y1) strip per worker, none shorter than REPROJECT_MIN_STRIP_HEIGHT."""
+    strip_height = max(math.ceil(height / REPROJECT_WORKERS), REPROJECT_MIN_STRIP_HEIGHT)
+    return [(y0, min(y0 + strip_height, height)) for y0 in range(0, height, strip_height)]
+
+
+def process_in_strips(height, process_strip):
+    """Calls process_strip(y0, y1) for each strip of rows 0:height, on a thread pool when there are several."""
+    strips = split_into_strips(height)
+    if len(strips) == 1:
+        process_strip(0, height)
+        return
+    with ThreadPoolExecutor(max_workers=len(strips)) as executor:
+        for future in [executor.submit(process_strip, y0, y1) for y0, y1 in strips]:
+            future.result()
+
+
+def reproject_skymap_cpu(output_wcs, output_shape):
+    """Reprojects the FOV crop of the skymap onto the output frame on the CPU.
+
+    With Numba, a fused kernel maps and bilinearly samples the uint8 skymap straight into the
+    uint8 output; otherwise SciPy's map_coordinates is used. Horizontal strips of the output are
+    processed on a thread pool, since both release the GIL. Returns an (H, W, 3) uint8 image.
+    """
+    # Only the part of the skymap covered by the camera FOV is resampled. The crop is padded,
+    # so clamping at its edges never shows in the frame.
+    cropped_data, cropped_wcs = crop_skymap_to_fov(output_wcs, output_shape)
+    height, width = output_shape[-2:]
+    if njit is not None:
+        cropped_data = np.ascontiguousarray(cropped_data)
+        reprojected_data = np.empty((height, width, output_shape[0]), dtype=np.uint8)
+    else:
+        channel_data = np.empty(output_shape, dtype=np.float32)
+
+    def reproject_strip(y0, y1):
+        if njit is not None:
+            _reproject_bilinear_kernel(cropped_data, *output_wcs.wcs.crpix, *output_wcs.wcs.cdelt, *output_wcs.wcs.crval,
+                                       *cropped_wcs.wcs.crpix, *cropped_wcs.wcs.cdelt, *cropped_wcs.wcs.crval,
+                                       y0, reprojected_data[y0:y1])
+            return
+        # The pixel mapping is computed once and shared by all three colour channels
+        coords = tan_to_car_pixels(output_wcs, cropped_wcs, width, y0, y1)
+        for c in range(cropped_data.shape[0]):
+            map_coordinates(cropped_data[c], coords, output=channel_data[c, y0:y1], order=1, mode='nearest')
+
+    process_in_strips(height, reproject_strip)
+
+    if njit is not None:
+        return reprojected_data
+    return finalize_channels(channel_data)
+
+
+if njit is not None:
+    @njit(nogil=True, fastmath=True, cache=True)
+    def _bin_skymap_kernel(image, y0, y1, cos_delta_ra, sin_delta_ra,
+                           crop_crpix_y, crop_cdelt_y, crop_dec0,
+                           out_crpix_x, out_crpix_y, out_cdelt_x, out_cdelt_y, dec0,
+                           sums, counts):
+        # Projects rows y0:y1 of the skymap crop forward onto the output frame and adds each pixel
+        # to the output pixel it lands in. The RA terms of each crop column are precomputed, so the
+        # gnomonic projection needs no trigonometry per pixel. Only the columns they are given for are
+        # binned. Sums are (H, W, C) so the channels of an output pixel are updated together.
+        sin_dec0 = math.sin(math.radians(dec0))
+        cos_dec0 = math.cos(math.radians(dec0))
+        height, width = counts.shape
+        for i in range(y0, y1):
+            dec = math.radians(crop_dec0 + (i + 1 - crop_crpix_y) * crop_cdelt_y)
+            sin_dec = math.sin(dec)
+            cos_dec = math.cos(dec)
+            for j in range(cos_delta_ra.shape[0]):
+                cos_c = sin_dec0 * sin_dec + cos_dec0 * cos_dec * cos_delta_ra[j]
+                # Skip pixels behind the tangent plane
+                if cos_c <= 0:
+                    continue
+                xi = cos_dec * sin_delta_ra[j] / cos_c
+                eta = (cos_dec0 * sin_dec - sin_dec0 * cos_dec * cos_delta_ra[j]) / cos_c
+                px = math.floor(out_crpix_x - 0.5 + math.degrees(xi) / out_cdelt_x)
+                py = math.floor(out_crpix_y - 0.5 + math.degrees(eta) / out_cdelt_y)
+                if px < 0 or px >= width or py < 0 or py >= height:
+                    continue
+                ix = int(px)
+                iy = int(py)
+                counts[iy, ix] += 1
+                for c in range(image.shape[0]):
+                    sums[iy, ix, c] += image[c, i, j]
+
+    @njit(nogil=True, cache=True)
+    def _average_bins_kernel(sums, counts, y0, y1, out):
+        # Adds up the accumulators of all strips for output rows y0:y1 and writes the averages as
+        # uint8 RGB. Output pixels no skymap pixel landed in are black.
+        for i in range(y0, y1):
+            for j in range(out.shape[1]):
+                count = 0
+                for s in range(counts.shape[0]):
+                    count += counts[s, i, j]
+                for c in range(out.shape[2]):
+                    if count == 0:
+                        out[i, j, c] = 0
+                        continue
+                    total = np.float32(0)
+                    for s in range(sums.shape[0]):
+                        total += sums[s, i, j, c]
+                    out[i, j, c] = np.uint8(min(total / count, 255))
+
+
+def bin_skymap_to_frame(output_wcs, output_shape):
+    """Resamples the skymap onto a coarser output frame by binning instead of interpolating.
+
+    Every skymap pixel in the FOV crop is projected forward into the output frame and averaged
+    into the output pixel it lands in, so no stars are skipped when downsampling. Strips of crop
+    rows are binned on a thread pool into separate accumulators that are summed at the end.
+    Requires Numba. Returns an (H, W, 3) uint8 image.
+    """
+    cropped_data, cropped_wcs = crop_skymap_to_fov(output_wcs, output_shape)
+    channels, height, width = output_shape
+
+    cropped_data = np.ascontiguousarray(cropped_data)
+    crop_height = cropped_data.shape[1]
+    # Crops around a pole (or wider than the sky) wrap some columns in twice. Binning every column
+    # would count those skymap pixels twice, so only one full turn of RA is binned.
+    crop_width = min(cropped_data.shape[2], input_data.shape[2])
+    # CAR is linear, so the RA of each crop column and the Dec of each crop row follow directly
+    ra0 = np.radians(output_wcs.wcs.crval[0])
+    delta_ra = np.radians(cropped_wcs.wcs.crval[0] + (np.arange(crop_width) + 1 - cropped_wcs.wcs.crpix[0]) * cropped_wcs.wcs.cdelt[0]) - ra0
+    cos_delta_ra = np.cos(delta_ra)
+    sin_delta_ra = np.sin(delta_ra)
+
+    # Binned frames have coarse pixels, so their accumulators are small next to the crop and
+    # each strip can have its own instead of synchronising on shared ones
+    strips = split_into_strips(crop_height)
+    sums = np.zeros((len(strips), height, width, channels), dtype=np.float32)
+    counts = np.zeros((len(strips), height, width), dtype=np.int32)
+    strip_index = {y0: s for s, (y0, _) in enumerate(strips)}
+
+    def bin_strip(y0, y1):
+        s = strip_index[y0]
+        _bin_skymap_kernel(cropped_data, y0, y1, cos_delta_ra, sin_delta_ra,
+                           cropped_wcs.wcs.crpix[1], cropped_wcs.wcs.cdelt[1], cropped_wcs.wcs.crval[1],
+                           *output_wcs.wcs.crpix, *output_wcs.wcs.cdelt, output_wcs.wcs.crval[1],
+                           sums[s], counts[s])
+
+    process_in_strips(crop_height, bin_strip)
+
+    binned_data = np.empty((height, width, channels), dtype=np.uint8)
+    process_in_strips(height, lambda y0, y1: _average_bins_kernel(sums, counts, y0, y1, binned_data))
+    return binned_data
+
+
+class SkymapRenderKey(NamedTuple):
+    """Everything a rendered skymap crop depends on, used as its cache key."""
+    render_version: int
+    binning: bool
+    skymap_version: str
+    ra: float
+    dec: float
+    sensor_width_px: int
+    sensor_height_px: int
+    focal_length: float
+    pixel_pitch: float
+    image_format: str
+
+
+def skymap_cache_digest(cache_key):
+    """Returns a stable hex digest for a rendered skymap cache key, used for cache files and ETags."""
+    return hashlib.sha1(repr(cache_key).encode()).hexdigest()
+
+
+def prune_skymap_cache_dir():
+    """Deletes the least recently used rendered images once SKYMAP_CACHE_DIR grows past its size limit."""
+    entries = []
+    for entry in os.scandir(SKYMAP_CACHE_DIR):
+        if entry.name.endswith('.tmp'):
+            continue
+        try:
+            stat = entry.stat()
+        except FileNotFoundError:
+            continue
+        entries.append((stat.st_mtime, stat.st_size, entry.path))
+
+    total_bytes = sum(size for _, size, _ in entries)
+    for _, size, path in sorted(entries):
+        if total_bytes <= SKYMAP_CACHE_DIR_MAX_BYTES:
+            break
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        total_bytes -= size
+
+
+# Images larger than the whole memory budget are simply not kept in memory
+@cached(LRUCache(maxsize=SKYMAP_CACHE_MEMORY_MAX_BYTES, getsizeof=len), lock=threading.Lock())
+def render_skymap_image(key):
+    """Renders the skymap crop described by a SkymapRenderKey.
+
+    Returns the encoded image bytes. Rendered images are also kept in SKYMAP_CACHE_DIR so they
+    survive server restarts.
+    """
+    cache_path = os.path.join(SKYMAP_CACHE_DIR, f"{skymap_cache_digest(key)}.{key.image_format}")
+    try:
+        with open(cache_path, 'rb') as f:
+            image_bytes = f.read()
+    except FileNotFoundError:
+        image_bytes = None
+    if image_bytes is not None:
+        # Refresh the modification time so pruning removes the least recently used images first
+        try:
+            os.utime(cache_path)
+        except FileNotFoundError:
+            pass
+        return image_bytes
+
+    # FOV Calculation
+    fov_width_deg = 2 * math.degrees(math.atan((key.pixel_pitch * key.sensor_width_px / 2000) / key.focal_length))
+    fov_height_deg = 2 * math.degrees(math.atan((key.pixel_pitch * key.sensor_height_px / 2000) / key.focal_length))
+    
+    # Output WCS Definition
+    output_wcs = WCS(naxis=2)
+    output_wcs.wcs.crpix = [(key.sensor_width_px + 1) / 2, (key.sensor_height_px + 1) / 2]
+    output_wcs.wcs.cdelt = np.array([-fov_width_deg / key.sensor_width_px, fov_height_deg / key.sensor_height_px])
+    output_wcs.wcs.crval = [key.ra, key.dec]
+    output_wcs.wcs.ctype = ["RA---TAN", "DEC--TAN"]
+
+    # Reprojection
+    print(f"Reprojecting for target at RA {key.ra:.2f}, Dec {key.dec:.2f}...")
+    output_shape = (3, key.sensor_height_px, key.sensor_width_px)
+    
+    # When output pixels cover several skymap pixels, optionally bin rather than interpolate so no detail
+    # is skipped. Without Numba binning is several times slower still, so it is only done with it.
+    binning_ratio = np.abs(output_wcs.wcs.cdelt).min() / np.abs(input_wcs.wcs.cdelt).max()
+    if SKYMAP_BINNING and njit is not None and binning_ratio >= SKYMAP_BINNING_MIN_RATIO:
+        reprojected_data = bin_skymap_to_frame(output_wcs, output_shape)
+    elif input_data_gpu is not None:
+        reprojected_data = finalize_channels(reproject_skymap_gpu(output_wcs, output_shape))
+    else:
+        reprojected_data = reproject_skymap_cpu(output_wcs, output_shape)
+    print("Reprojection complete.")
+
+    # Encode the response image
+    if key.image_format == 'jpeg' and simplejpeg is not None:
+        # libjpeg-turbo's SIMD DCT and colour conversion are several times faster than Pillow
+        image_bytes = simplejpeg.encode_jpeg(reprojected_data, quality=85,
+                                             colorspace='RGB', fastdct=True)
+    else:
+        output_image = Image.fromarray(reprojected_data)
+        pil_format, _, save_options = SKYMAP_IMAGE_FORMATS[key.image_format]
+        img_io = io.BytesIO()
+        output_image.save(img_io, pil_format, **save_options)
+        image_bytes = img_io.getvalue()
+
+    # Concurrent requests never read a partial image
+    os.makedirs(SKYMAP_CACHE_DIR, exist_ok=True)
+    atomic_write(cache_path, lambda f: f.write(image_bytes))
+    prune_skymap_cache_dir()
+    return image_bytes
+
+
+@lru_cache(maxsize=4096)
+def resolve_target(target_name):
+    """Resolves a target name to ICRS coordinates via Sesame, caching the result per name."""
+    return get_icrs_coordinates(target_name)
 
 
 def get_apparent_coords(data):
@@ -73,7 +674,7 @@ def get_apparent_coords(data):
 
     location = EarthLocation(lon=data['longitude']*u.deg, lat=data['latitude']*u.deg)
     obstime = Time.now()
-    base_coords = get_icrs_coordinates(data['target_name'])
+    base_coords = resolve_target(data['target_name'])
     altaz_frame = AltAz(obstime=obstime, location=location)
     apparent_icrs = base_coords.transform_to(altaz_frame).transform_to('icrs')
     return apparent_icrs
@@ -103,45 +704,35 @@ def get_skymap_crop():
         sensor_width_px = data.get('sensor_width_px')
         sensor_height_px = data.get('sensor_height_px')
         pixel_pitch = data.get('pixel_pitch')
+        # JPEG is much faster to encode than PNG and is good enough for a preview
+        image_format = str(data.get('format') or 'jpeg').lower()
 
         if not all([focal_length, sensor_width_px, sensor_height_px, pixel_pitch]):
             return jsonify({'error': 'Missing required camera parameters.'}), 400
+        if image_format not in SKYMAP_IMAGE_FORMATS:
+            return jsonify({'error': f"Unsupported image format '{image_format}'."}), 400
 
         coords = get_apparent_coords(data)
         
-        # FOV Calculation
-        fov_width_deg = 2 * math.degrees(math.atan((pixel_pitch * sensor_width_px / 2000) / focal_length))
-        fov_height_deg = 2 * math.degrees(math.atan((pixel_pitch * sensor_height_px / 2000) / focal_length))
-        
-        # Output WCS Definition
-        output_wcs = WCS(naxis=2)
-        output_wcs.wcs.crpix = [(sensor_width_px + 1) / 2, (sensor_height_px + 1) / 2]
-        output_wcs.wcs.cdelt = np.array([-fov_width_deg / sensor_width_px, fov_height_deg / sensor_height_px])
-        output_wcs.wcs.crval = [coords.ra.degree, coords.dec.degree]
-        output_wcs.wcs.ctype = ["RA---TAN", "DEC--TAN"]
+        # Rendered crops are cached on the renderer and skymap versions, the rounded target position,
+        # camera parameters and format
+        cache_key = SkymapRenderKey(render_version=SKYMAP_RENDER_VERSION, binning=SKYMAP_BINNING,
+                                    skymap_version=skymap_version,
+                                    ra=round(coords.ra.degree, 3), dec=round(coords.dec.degree, 3),
+                                    sensor_width_px=sensor_width_px, sensor_height_px=sensor_height_px,
+                                    focal_length=focal_length, pixel_pitch=pixel_pitch, image_format=image_format)
 
-        # Reprojection
-        print(f"Reprojecting for target at RA {coords.ra.degree:.2f}, Dec {coords.dec.degree:.2f}...")
-        output_shape = (sensor_height_px, sensor_width_px)
-        
-        # DEFINITIVE FIX: Reproject each color channel individually.
-        # The input to reproject_interp must be a tuple of (data, wcs).
-        r_data, _ = reproject_interp((input_data[0], input_wcs), output_wcs, shape_out=output_shape)
-        g_data, _ = reproject_interp((input_data[1], input_wcs), output_wcs, shape_out=output_shape)
-        b_data, _ = reproject_interp((input_data[2], input_wcs), output_wcs, shape_out=output_shape)
-        
-        # Stack the reprojected channels back into an RGB image.
-        reprojected_data = np.stack([r_data, g_data, b_data], axis=-1)
-
-        reprojected_data = np.nan_to_num(reprojected_data).astype(np.uint8)
-        print("Reprojection complete.")
-
-        # Prepare and Send Response
-        output_image = Image.fromarray(reprojected_data)
-        img_io = io.BytesIO()
-        output_image.save(img_io, 'PNG')
-        img_io.seek(0)
-        return send_file(img_io, mimetype='image/png')
+        # The ETag identifies the rendered image through the same versioned key, so a client that
+        # already has it gets a 304 without any reprojection or transfer
+        etag = skymap_cache_digest(cache_key)
+        if request.if_none_match.contains(etag):
+            response = app.response_class(status=304)
+            response.cache_control.max_age = 3600
+        else:
+            image_bytes = render_skymap_image(cache_key)
+            response = send_file(io.BytesIO(image_bytes), mimetype=SKYMAP_IMAGE_FORMATS[image_format][1], max_age=3600)
+        response.set_etag(etag)
+        return response
         
     except Exception as e:
         print("--- AN ERROR OCCURRED DURING SKYMAP PROCESSING ---")
@@ -169,7 +760,7 @@ def get_session_key():
     if not API_KEY or API_KEY == "YOUR_API_KEY_HERE":
         raise Exception("Astrometry.net API key not configured in config.py.")
 
-    response = requests.post(f'{ASTROMETRY_API_URL}/login', data={'request-json': json.dumps({'apikey': API_KEY})})
+    response = astrometry_session.post(f'{ASTROMETRY_API_URL}/login', data={'request-json': json.dumps({'apikey': API_KEY})})
     response.raise_for_status()
     data = response.json()
     if data.get('status') == 'success':
@@ -189,7 +780,7 @@ def upload_image():
         upload_data = {'session': current_session_key, "publicly_visible": "n"}
         files = {'file': (file.filename, file.read(), file.mimetype)}
         
-        response = requests.post(f'{ASTROMETRY_API_URL}/upload', data={'request-json': json.dumps(upload_data)}, files=files)
+        response = astrometry_session.post(f'{ASTROMETRY_API_URL}/upload', data={'request-json': json.dumps(upload_data)}, files=files)
         response.raise_for_status()
         data = response.json()
         if data.get('status') == 'success': 
@@ -199,19 +790,28 @@ def upload_image():
     except Exception as e: 
         return jsonify({'error': str(e)}), 500
 
+def get_astrometry_status_json(path):
+    # GETs a submission/job status from Astrometry.net, served from the short-lived cache when possible
+    with astrometry_status_lock:
+        if path in astrometry_status_cache:
+            return astrometry_status_cache[path]
+
+    response = astrometry_session.get(f'{ASTROMETRY_API_URL}{path}')
+    response.raise_for_status()
+    data = response.json()
+    with astrometry_status_lock:
+        astrometry_status_cache[path] = data
+    return data
+
 @app.route('/api/status/<int:sub_id>', methods=['GET'])
 def get_status(sub_id):
     # Polls for the status of an analysis job
     try:
-        response = requests.get(f'{ASTROMETRY_API_URL}/submissions/{sub_id}')
-        response.raise_for_status()
-        data = response.json()
+        data = get_astrometry_status_json(f'/submissions/{sub_id}')
         job_id, status, annotated_url = None, 'pending', None
         if data.get('jobs') and data['jobs'] and data['jobs'][0] is not None:
             job_id = data['jobs'][0]
-            job_response = requests.get(f'{ASTROMETRY_API_URL}/jobs/{job_id}/info')
-            job_response.raise_for_status()
-            job_data = job_response.json()
+            job_data = get_astrometry_status_json(f'/jobs/{job_id}/info')
             status = job_data.get('status', 'unknown')
             if status == 'success':
                 annotated_url = f"http://nova.astrometry.net/annotated_display/{job_id}"
@@ -222,7 +822,7 @@ def get_status(sub_id):
 def get_results(job_id):
     # Retrieves the final annotations for a successful job
     try:
-        response = requests.get(f'{ASTROMETRY_API_URL}/jobs/{job_id}/annotations')
+        response = astrometry_session.get(f'{ASTROMETRY_API_URL}/jobs/{job_id}/annotations')
         response.raise_for_status()
         return jsonify({'annotations': response.json().get('annotations', [])})
     except Exception as e: return jsonify({'error': str(e)}), 500
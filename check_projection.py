@@ -0,0 +1,138 @@
+"""Checks the closed-form TAN -> CAR mapping in backend.tan_to_car_pixels against astropy.
+
+Run with `python check_projection.py`. Both the Numba kernel (when Numba is installed) and the
+NumPy fallback are compared with astropy.wcs.utils.pixel_to_pixel for an equatorial frame, a
+frame across the RA seam of the skymap, a frame containing the north celestial pole and one with
+the pole just outside it. For each frame, it also checks that backend.crop_skymap_to_fov keeps
+every skymap pixel the frame maps to, and that rendering through the crop with
+backend.reproject_skymap_cpu matches sampling the uncropped skymap.
+"""
+import math
+import sys
+
+import numpy as np
+from astropy.wcs import WCS
+from astropy.wcs.utils import pixel_to_pixel
+from scipy.ndimage import map_coordinates
+
+import backend
+
+# Shape of composite_skymap_16k.png
+MAP_WIDTH, MAP_HEIGHT = 16384, 8192
+SENSOR_WIDTH_PX, SENSOR_HEIGHT_PX = 600, 400
+# Largest allowed difference, in skymap pixels
+MAX_PIXEL_ERROR = 0.01
+# Largest allowed difference between rendering through the crop and sampling the uncropped skymap,
+# in 8-bit levels, as the two round differently
+MAX_RENDER_ERROR = 1
+
+# (name, ra, dec, focal length in mm, pixel pitch in um)
+FRAMES = [
+    ('equatorial', 83.8, -5.4, 50, 6.0),
+    ('across the RA seam', 180.0, 20.0, 35, 6.0),
+    ('containing the pole', 30.0, 88.5, 24, 6.0),
+    # 14 mm lens on a 36x24 mm sensor, reaching Dec 89.8
+    ('pole just outside the frame', 30.0, 54.5, 14, 60.0),
+]
+
+
+def make_map_wcs():
+    # Same WCS as load_skymap_data
+    w = WCS(naxis=2)
+    w.wcs.crpix = [(MAP_WIDTH + 1) / 2, (MAP_HEIGHT + 1) / 2]
+    w.wcs.cdelt = np.array([-360. / MAP_WIDTH, -180. / MAP_HEIGHT])
+    w.wcs.crval = [0, 0]
+    w.wcs.ctype = ["RA---CAR", "DEC--CAR"]
+    return w
+
+
+def make_output_wcs(ra, dec, focal_length, pixel_pitch):
+    # Same WCS as render_skymap_image
+    fov_width_deg = 2 * math.degrees(math.atan((pixel_pitch * SENSOR_WIDTH_PX / 2000) / focal_length))
+    fov_height_deg = 2 * math.degrees(math.atan((pixel_pitch * SENSOR_HEIGHT_PX / 2000) / focal_length))
+    w = WCS(naxis=2)
+    w.wcs.crpix = [(SENSOR_WIDTH_PX + 1) / 2, (SENSOR_HEIGHT_PX + 1) / 2]
+    w.wcs.cdelt = np.array([-fov_width_deg / SENSOR_WIDTH_PX, fov_height_deg / SENSOR_HEIGHT_PX])
+    w.wcs.crval = [ra, dec]
+    w.wcs.ctype = ["RA---TAN", "DEC--TAN"]
+    return w
+
+
+def max_error(output_wcs, map_wcs):
+    coords = backend.tan_to_car_pixels(output_wcs, map_wcs, SENSOR_WIDTH_PX, 0, SENSOR_HEIGHT_PX)
+    out_y, out_x = np.mgrid[0:SENSOR_HEIGHT_PX, 0:SENSOR_WIDTH_PX]
+    expected_x, expected_y = pixel_to_pixel(output_wcs, map_wcs, out_x, out_y)
+
+    # tan_to_car_pixels may return columns past the RA seam, which are the same sky
+    error_x = (coords[1] - expected_x + MAP_WIDTH / 2) % MAP_WIDTH - MAP_WIDTH / 2
+    error_y = coords[0] - expected_y
+    # RA is undefined at the pole itself, so skip output pixels right next to it
+    _, dec = output_wcs.wcs_pix2world(out_x, out_y, 0)
+    valid = np.abs(dec) < 89.99
+    return max(np.abs(error_x[valid]).max(), np.abs(error_y).max())
+
+
+def make_skymap():
+    # Smooth stripes along both axes, so sampling the wrong row or column shows up in the render
+    y = np.arange(MAP_HEIGHT)
+    x = np.arange(MAP_WIDTH)
+    rows = (63.5 + 63.5 * np.sin(2 * np.pi * y / 37)).astype(np.uint8)
+    columns = (63.5 + 63.5 * np.cos(2 * np.pi * x / 53)).astype(np.uint8)
+    return np.add.outer(rows, columns)
+
+
+def min_crop_margin(output_wcs):
+    """Returns how far, in skymap pixels, the frame stays inside its crop (negative if it leaves it)."""
+    cropped_data, cropped_wcs = backend.crop_skymap_to_fov(output_wcs, (3, SENSOR_HEIGHT_PX, SENSOR_WIDTH_PX))
+    coords = backend.tan_to_car_pixels(output_wcs, cropped_wcs, SENSOR_WIDTH_PX, 0, SENSOR_HEIGHT_PX)
+    crop_height, crop_width = cropped_data.shape[-2:]
+    # Measured to the outer edges of the crop's pixels, as the poles lie on the edges of the skymap
+    return min(coords[0].min() + 0.5, crop_height - 0.5 - coords[0].max(),
+               coords[1].min() + 0.5, crop_width - 0.5 - coords[1].max())
+
+
+def max_render_error(output_wcs, map_wcs, skymap):
+    """Returns the largest difference between reproject_skymap_cpu and sampling the whole skymap."""
+    rendered = backend.reproject_skymap_cpu(output_wcs, (3, SENSOR_HEIGHT_PX, SENSOR_WIDTH_PX))
+    coords = backend.tan_to_car_pixels(output_wcs, map_wcs, SENSOR_WIDTH_PX, 0, SENSOR_HEIGHT_PX)
+    # Only RA wraps around, rows beyond the poles are clamped like the renderers do
+    np.clip(coords[0], 0, MAP_HEIGHT - 1, out=coords[0])
+    expected = map_coordinates(skymap, coords, order=1, mode='grid-wrap').astype(np.uint8)
+    return np.abs(rendered.astype(int) - expected[..., None]).max()
+
+
+def main():
+    map_wcs = make_map_wcs()
+    skymap = make_skymap()
+    backend.input_data = np.broadcast_to(skymap, (3, MAP_HEIGHT, MAP_WIDTH))
+    backend.input_wcs = map_wcs
+    implementations = [('NumPy', None)]
+    if backend.njit is not None:
+        implementations.insert(0, ('Numba', backend.njit))
+
+    failed = False
+    for implementation, njit in implementations:
+        # tan_to_car_pixels picks the Numba kernel whenever njit is available
+        backend.njit = njit
+        for name, ra, dec, focal_length, pixel_pitch in FRAMES:
+            error = max_error(make_output_wcs(ra, dec, focal_length, pixel_pitch), map_wcs)
+            status = 'OK' if error <= MAX_PIXEL_ERROR else 'FAIL'
+            failed |= error > MAX_PIXEL_ERROR
+            print(f"{status}: {implementation}, {name}: max error {error:.5f} px")
+
+            # Rendering goes through crop_skymap_to_fov, so this also catches a crop that is too small
+            error = max_render_error(make_output_wcs(ra, dec, focal_length, pixel_pitch), map_wcs, skymap)
+            status = 'OK' if error <= MAX_RENDER_ERROR else 'FAIL'
+            failed |= error > MAX_RENDER_ERROR
+            print(f"{status}: {implementation}, {name}: render through the crop differs by up to {error}")
+
+    for name, ra, dec, focal_length, pixel_pitch in FRAMES:
+        margin = min_crop_margin(make_output_wcs(ra, dec, focal_length, pixel_pitch))
+        status = 'OK' if margin >= 0 else 'FAIL'
+        failed |= margin < 0
+        print(f"{status}: crop, {name}: frame stays {margin:.1f} px inside the crop")
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())